@@ -1,133 +1,790 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from werkzeug.wsgi import wrap_file
+import orjson
 import yt_dlp
 import os
 import tempfile
 import json
-from urllib.parse import urlparse
+import decimal
+from urllib.parse import urlparse, quote
 import re
 import threading
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+from fractions import Fraction
 import zipfile
-import io
-import ffmpeg
+import hashlib
 import subprocess
 import shutil
+import itertools
+import functools
+import heapq
+import queue
+import selectors
+import contextlib
+import mimetypes
 from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import PyNvVideoCodec as nvc  # Optional: direct NVDEC/NVENC access on GPU hosts
+except ImportError:
+    nvc = None
+
+try:
+    import liburing  # Optional (liburing==2026.3.30): batched unlinks through io_uring on Linux
+except ImportError:
+    liburing = None
+
+def _uring_setup_flags():
+    """Ring setup flags this kernel accepts, or None if io_uring can't be used
+    
+    Each ring is used by the one thread that creates it, so SINGLE_ISSUER and
+    DEFER_TASKRUN (completions run only when that thread waits, Linux 6.1+)
+    apply; older kernels reject them and get a plain ring.
+    """
+    try:
+        if not all(callable(getattr(liburing, name)) for name in (
+                'Ring', 'Cqe', 'io_uring_prep_unlink', 'io_uring_cq_ready', 'io_uring_cq_advance')):
+            raise AttributeError('unsupported liburing release')
+        preferred = liburing.IORING_SETUP_SINGLE_ISSUER | liburing.IORING_SETUP_DEFER_TASKRUN
+    except AttributeError as e:
+        print(f"liburing unusable, temp cleanup will unlink one by one: {e}")
+        return None
+    for flags in (preferred, 0):
+        ring = liburing.Ring()
+        try:
+            liburing.io_uring_queue_init(1, ring, flags)
+        except OSError as e:
+            error = e
+            continue
+        liburing.io_uring_queue_exit(ring)
+        return flags
+    print(f"io_uring unavailable, temp cleanup will unlink one by one: {error}")
+    return None
+
+URING_SETUP_FLAGS = _uring_setup_flags() if liburing is not None else None
+if URING_SETUP_FLAGS is None:
+    liburing = None
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    # Accept int/float dict keys like the stdlib encoder does
+    OPTIONS = orjson.OPT_NON_STR_KEYS
+    
+    @staticmethod
+    def _default(obj):
+        # Types Flask's default provider serialises that orjson doesn't natively
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        if hasattr(obj, '__html__'):
+            return str(obj.__html__())
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self._default, option=self.OPTIONS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping a decode/encode
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self._default, option=self.OPTIONS),
+                                        mimetype='application/json')
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
-# Configure temp directory
-TEMP_DIR = tempfile.mkdtemp()
-DOWNLOAD_TASKS = {}  # Store download progress
+URL_PATTERN = re.compile(
+    r'^https?://'
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'
+    r'localhost|'
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
+    r'(?::\d+)?'
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
+# Configure temp directory; TEMP_ROOT lets a reverse proxy serve it (see file_response)
+TEMP_DIR = tempfile.mkdtemp(dir=os.environ.get('TEMP_ROOT'))
+TEMP_DIR_REAL = os.path.realpath(TEMP_DIR)
+
+# Offload file bodies to the reverse proxy: 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile)
+SENDFILE_BACKEND = os.environ.get('SENDFILE_BACKEND', '').lower()
+SENDFILE_PREFIX = os.environ.get('SENDFILE_PREFIX', '/internal/')
+
+class TaskStore:
+    """Thread-safe, bounded store for download task state
+    
+    Each task carries a monotonic 'expiry_mono' timestamp, ttl seconds after it
+    was last written. Writes move the task to the back of the OrderedDict, so
+    tasks stay sorted by expiry and sweep() only has to pop expired entries off
+    the front. Once max_tasks is exceeded the task closest to expiry is evicted.
+    Reads return copies, without the internal fields, so callers never observe
+    a task mid-update; 'start_time' stays an ISO string for clients.
+    
+    Every write also bumps the task's revision and wakes wait_for_change(), so
+    streaming clients hear about progress without polling.
+    """
+    
+    INTERNAL_FIELDS = frozenset({'expiry_mono', 'revision'})
+    
+    def __init__(self, max_tasks=1024, ttl=3600, sweep_interval=300):
+        self._tasks = OrderedDict()
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._revisions = itertools.count(1)
+        self.max_tasks = max_tasks
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._schedule_sweep()
+    
+    def set(self, task_id, task):
+        with self._lock:
+            self._tasks[task_id] = task
+            self._touch(task_id)
+            while len(self._tasks) > self.max_tasks:
+                self._tasks.popitem(last=False)
+    
+    def get(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            return self._public(task)
+    
+    def wait_for_change(self, task_id, revision=None, timeout=None):
+        """Block until the task's revision differs from revision
+        
+        Returns (task copy, revision), or (None, None) once the task is gone.
+        On timeout the unchanged task and revision are returned.
+        """
+        with self._changed:
+            def changed():
+                task = self._tasks.get(task_id)
+                return task is None or task['revision'] != revision
+            self._changed.wait_for(changed, timeout)
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None, None
+            return self._public(task), task['revision']
+    
+    def update(self, task_id, **fields):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None:
+                task.update(fields)
+                self._touch(task_id)
+    
+    def append(self, task_id, key, item):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None:
+                task[key].append(item)
+                self._touch(task_id)
+    
+    def delete(self, task_id):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._changed.notify_all()
+    
+    def items(self):
+        with self._lock:
+            return [(task_id, self._public(task)) for task_id, task in self._tasks.items()]
+    
+    def sweep(self):
+        """Drop expired tasks from the front; returns the number removed"""
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._tasks and next(iter(self._tasks.values()))['expiry_mono'] < now:
+                self._tasks.popitem(last=False)
+                removed += 1
+            if removed:
+                self._changed.notify_all()
+        return removed
+    
+    def _public(self, task):
+        return {k: list(v) if isinstance(v, list) else v for k, v in task.items() if k not in self.INTERNAL_FIELDS}
+    
+    def _touch(self, task_id):
+        task = self._tasks[task_id]
+        task['expiry_mono'] = time.monotonic() + self.ttl
+        task['revision'] = next(self._revisions)
+        self._tasks.move_to_end(task_id)
+        self._changed.notify_all()
+    
+    def _schedule_sweep(self):
+        timer = threading.Timer(self.sweep_interval, self._janitor)
+        timer.daemon = True
+        timer.start()
+    
+    def _janitor(self):
+        try:
+            self.sweep()
+        finally:
+            self._schedule_sweep()
+    
+    def __contains__(self, task_id):
+        with self._lock:
+            return task_id in self._tasks
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._tasks)
+
+DOWNLOAD_TASKS = TaskStore()  # Store download progress
+
+URING_BATCH = 256
+
+def unlink_many(paths):
+    """Delete files, returning how many were removed
+    
+    With liburing the unlinks are queued as io_uring SQEs and submitted in
+    batches of URING_BATCH, one io_uring_enter per batch instead of one
+    syscall per file. Falls back to os.unlink when io_uring is unavailable.
+    """
+    if liburing is not None and paths:
+        return _uring_unlink(paths)
+    
+    removed = 0
+    for path in paths:
+        try:
+            os.unlink(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def _uring_unlink(paths):
+    # The ring is created per call since requests run on different threads
+    # and SINGLE_ISSUER ties a ring to the thread that submits to it
+    ring = liburing.Ring()
+    cqe = liburing.Cqe()
+    liburing.io_uring_queue_init(URING_BATCH, ring, URING_SETUP_FLAGS)
+    removed = 0
+    try:
+        for start in range(0, len(paths), URING_BATCH):
+            # The SQEs point into these strings, so they must outlive the submit
+            batch = [os.path.abspath(path) for path in paths[start:start + URING_BATCH]]
+            for path in batch:
+                sqe = liburing.io_uring_get_sqe(ring)
+                liburing.io_uring_prep_unlink(sqe, path)
+            liburing.io_uring_submit_and_wait(ring, len(batch))
+            pending = len(batch)
+            while pending:
+                liburing.io_uring_wait_cqe(ring, cqe)
+                ready = liburing.io_uring_cq_ready(ring)
+                for i in range(ready):
+                    try:
+                        result = cqe[i].res  # Raises OSError for a failed unlink
+                    except FileNotFoundError:
+                        continue
+                    if result >= 0:
+                        removed += 1
+                liburing.io_uring_cq_advance(ring, ready)
+                pending -= ready
+    finally:
+        liburing.io_uring_queue_exit(ring)
+    return removed
+
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_ok():
+    """Whether ffmpeg and ffprobe are on PATH (checked once per process)"""
+    return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+class FFmpegError(Exception):
+    """Raised when an ffmpeg/ffprobe invocation exits with an error"""
+
+class FFmpegBusyError(Exception):
+    """Raised when no FFmpeg job slot frees up within the queue timeout"""
+
+# Last "time=HH:MM:SS.xx" in a chunk of ffmpeg -stats output
+FFMPEG_TIME_RE = re.compile(rb'time=\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)')
+FFMPEG_STATS_LINE_RE = re.compile(rb'\s*(?:frame|size)=')
+
+class _StderrWatch:
+    """State for one ffmpeg stderr pipe registered with StderrMonitor"""
+    
+    def __init__(self, stream, on_time, on_done):
+        self.stream = stream
+        self.on_time = on_time
+        self.on_done = on_done
+        self.tail = b''
+        self.done = threading.Event()
+    
+    def error_text(self):
+        """The captured stderr without the -stats progress lines"""
+        lines = re.split(rb'[\r\n]+', self.tail)
+        return b'\n'.join(
+            line for line in lines if line and not FFMPEG_STATS_LINE_RE.match(line)
+        ).decode(errors='replace').strip()
+
+class StderrMonitor:
+    """One thread multiplexing the stderr of every running ffmpeg with selectors
+    
+    Pipes are read non-blocking in 64 KiB chunks and scanned as bytes; only the
+    last progress time in each chunk is reported, so a burst of stats lines
+    costs a single callback.
+    """
+    
+    TAIL_SIZE = 64 * 1024
+    
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Self-pipe to wake select() when a new stream is registered
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+    
+    def watch(self, stream, on_time=None, on_done=None):
+        """Monitor stream, calling on_time(seconds) as ffmpeg reports progress
+        
+        Without on_time the stream is only drained, keeping its tail for
+        error_text(), so a chatty ffmpeg never blocks on a full stderr pipe.
+        on_done is called once the stream hits EOF, i.e. when ffmpeg exits.
+        """
+        watch = _StderrWatch(stream, on_time, on_done)
+        os.set_blocking(stream.fileno(), False)
+        with self._lock:
+            self._selector.register(stream.fileno(), selectors.EVENT_READ, watch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='ffmpeg-stderr', daemon=True)
+                self._thread.start()
+        os.write(self._wake_w, b'\0')
+        return watch
+    
+    def _loop(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._drain(key)
+    
+    def _drain(self, key):
+        watch = key.data
+        try:
+            chunk = os.read(key.fd, 65536)
+        except BlockingIOError:
+            return
+        
+        if not chunk:
+            with self._lock:
+                self._selector.unregister(key.fd)
+            watch.stream.close()
+            watch.done.set()
+            if watch.on_done is not None:
+                watch.on_done()
+            return
+        
+        watch.tail = (watch.tail + chunk)[-self.TAIL_SIZE:]
+        matches = FFMPEG_TIME_RE.findall(chunk) if watch.on_time is not None else None
+        if matches:
+            hours, minutes, seconds = matches[-1]
+            try:
+                watch.on_time(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+            except Exception as e:
+                print(f"Progress callback failed: {e}")
+
+STDERR_MONITOR = StderrMonitor()
 
 class FFmpegProcessor:
     """Enhanced FFmpeg processing class"""
     
-    def __init__(self):
-        self.check_ffmpeg_availability()
+    # Containers that carry H.264 (libx264 or NVENC) output
+    H264_CONTAINERS = ('mp4', 'mkv', 'mov')
+    
+    # Default libx264 preset: much quicker than 'medium' at near-identical quality
+    DEFAULT_X264_PRESET = 'faster'
     
-    def check_ffmpeg_availability(self):
-        """Check if FFmpeg is available"""
+    # Muxer arguments for writing each output format to stdout. MP4-family
+    # containers are fragmented because a pipe can't be seeked back to write moov.
+    PIPE_MUXERS = {
+        'mp4': ('-movflags', '+frag_keyframe+empty_moov', '-f', 'mp4'),
+        'mov': ('-movflags', '+frag_keyframe+empty_moov', '-f', 'mov'),
+        'm4a': ('-movflags', '+empty_moov', '-frag_duration', '1000000', '-f', 'ipod'),
+        'mkv': ('-f', 'matroska'),
+        'webm': ('-f', 'webm'),
+        'avi': ('-f', 'avi'),
+        'mp3': ('-f', 'mp3'),
+        'aac': ('-f', 'adts'),
+        'wav': ('-f', 'wav'),
+        'ogg': ('-f', 'ogg'),
+        'flac': ('-f', 'flac')
+    }
+    
+    # Read size for streamed output; large reads amortise pipe syscalls
+    PIPE_CHUNK_SIZE = 64 * 1024
+    
+    # Default cores per concurrent FFmpeg job; x264 scales near-linearly to
+    # about this many threads
+    CORES_PER_JOB = 4
+    
+    # drawtext filter templates per watermark position
+    WATERMARK_FILTERS = {
+        position: "drawtext=textfile='{textfile}':expansion=none:fontcolor=white:fontsize=24:" + coords
+        for position, coords in {
+            'top-left': 'x=10:y=10',
+            'top-right': 'x=w-tw-10:y=10',
+            'bottom-left': 'x=10:y=h-th-10',
+            'bottom-right': 'x=w-tw-10:y=h-th-10',
+            'center': 'x=(w-tw)/2:y=(h-th)/2'
+        }.items()
+    }
+    
+    # Conversion quality -> (libx264 CRF, audio bitrate)
+    QUALITY_SETTINGS = {'high': (18, '320k'), 'medium': (23, '192k'), 'low': (28, '128k')}
+    
+    # libx264 CRF -> hardware encoder constant-quality equivalents
+    HW_CQ = {18: 19, 23: 23, 28: 28}
+    
+    # compress_video level -> (libx264 CRF, default preset). Lower levels
+    # trade more per-bit efficiency for speed: ultrafast encodes several times
+    # faster than veryfast, at a few percent larger output and ~0.5-1 dB lower
+    # PSNR for the same CRF.
+    COMPRESS_SETTINGS = {'high': (23, 'veryfast'), 'medium': (28, 'superfast'), 'low': (35, 'ultrafast')}
+    
+    # compress_video level -> hardware encoder constant quality
+    HW_COMPRESS_QUALITY = {'high': 23, 'medium': 28, 'low': 33}
+    
+    # Hardware H.264 encoders in order of preference. 'input' decodes on the
+    # same device and keeps frames in device memory; 'quality' is the encoder's
+    # constant-quality flag, 'presets' its speed preset per operation,
+    # 'scale' the on-device scaler used for resolution changes and 'probe'
+    # the arguments that feed it one software frame in the startup test encode.
+    HW_ENCODERS = {
+        'nvenc': {
+            'encoder': 'h264_nvenc',
+            'input': ('-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda'),
+            'output': ('-c:v', 'h264_nvenc', '-rc', 'vbr', '-tune', 'hq'),
+            'quality': '-cq',
+            'presets': {'convert': 'p4', 'compress': 'p4'},
+            'scale': 'scale_cuda=w=-2:h={height}:interp_algo=lanczos',
+            'probe': ()
+        },
+        'vaapi': {
+            'encoder': 'h264_vaapi',
+            'input': ('-hwaccel', 'vaapi', '-hwaccel_device', '/dev/dri/renderD128',
+                      '-hwaccel_output_format', 'vaapi'),
+            'output': ('-c:v', 'h264_vaapi', '-rc_mode', 'CQP'),
+            'quality': '-qp',
+            'presets': None,
+            'scale': 'scale_vaapi=w=-2:h={height}',
+            'probe': ('-vaapi_device', '/dev/dri/renderD128', '-vf', 'format=nv12,hwupload')
+        },
+        'qsv': {
+            'encoder': 'h264_qsv',
+            'input': ('-hwaccel', 'qsv', '-hwaccel_output_format', 'qsv'),
+            'output': ('-c:v', 'h264_qsv'),
+            'quality': '-global_quality',
+            'presets': {'convert': 'medium', 'compress': 'medium'},
+            'scale': 'scale_qsv=w=-2:h={height}',
+            'probe': ('-pix_fmt', 'nv12')
+        }
+    }
+    
+    def __init__(self, max_jobs=None):
+        # Concurrent ffmpeg processes are capped so a burst of requests queues
+        # instead of oversubscribing the CPU and the GPU encoder sessions. Each
+        # job slot owns a disjoint set of cores that its process is pinned to,
+        # with -threads matched to the set size.
+        if hasattr(os, 'sched_getaffinity'):
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(os.cpu_count() or 1))
+        self.max_jobs = min(len(cores), max_jobs or int(os.environ.get('FFMPEG_MAX_JOBS', 0))
+                            or max(2, len(cores) // self.CORES_PER_JOB))
+        self.threads_per_job = max(1, len(cores) // self.max_jobs)
+        self.thread_args = ('-threads', str(self.threads_per_job))
+        self._core_sets = queue.SimpleQueue()
+        for i in range(self.max_jobs):
+            self._core_sets.put(frozenset(cores[i * self.threads_per_job:(i + 1) * self.threads_per_job]))
+        # Streamed responses take core sets from the same pool, but at most
+        # max_streams at once, so client-paced downloads always leave a slot
+        # for file jobs and background post-processing
+        self.max_streams = min(self.max_jobs, int(os.environ.get('FFMPEG_MAX_STREAMS', 0))
+                               or max(1, self.max_jobs - 1))
+        self._stream_slots = threading.BoundedSemaphore(self.max_streams)
+        # Seconds a streamed request waits for a stream slot before FFmpegBusyError
+        # (HTTP 503); file jobs, including background post-processing, queue
+        # until a slot frees up
+        self.queue_timeout = float(os.environ.get('FFMPEG_QUEUE_TIMEOUT', 30))
+        # Summarised ffprobe results keyed by (path, mtime_ns, size); edits invalidate naturally
+        self._info_cache = functools.lru_cache(maxsize=1024)(self._video_info_impl)
+        # Per-thread progress callback installed by report_progress()
+        self._progress = threading.local()
+        # Core set of the job slot held by this thread, if any (see _job_slot)
+        self._held = threading.local()
+        
+        # Probe once at startup rather than on the first request
+        print("FFmpeg is available" if self.ffmpeg_available else "FFmpeg not available")
+        available = [name for name, present in self.hw_encoders.items() if present]
+        if available:
+            print(f"Hardware encoders available: {', '.join(available)}")
+    
+    @functools.cached_property
+    def ffmpeg_available(self):
+        """Whether ffmpeg and ffprobe can be run"""
+        return _ffmpeg_ok()
+    
+    @functools.cached_property
+    def encoders(self):
+        """Names of the encoders this FFmpeg build provides, from one `ffmpeg -encoders` run"""
+        if not self.ffmpeg_available:
+            return frozenset()
+        
         try:
-            result = subprocess.run(['ffmpeg', '-version'], 
+            result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
                                   capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                self.ffmpeg_available = True
-                print("FFmpeg is available")
-            else:
-                self.ffmpeg_available = False
-                print("FFmpeg not found")
         except (subprocess.TimeoutExpired, FileNotFoundError):
-            self.ffmpeg_available = False
-            print("FFmpeg not available")
+            return frozenset()
+        if result.returncode != 0:
+            return frozenset()
+        
+        # Rows look like " V....D h264_nvenc   NVIDIA NVENC H.264 encoder"
+        return frozenset(
+            fields[1] for fields in map(str.split, result.stdout.splitlines())
+            if len(fields) > 1 and len(fields[0]) == 6 and fields[1] != '='
+        )
+    
+    @functools.cached_property
+    def hw_encoders(self):
+        """Which of HW_ENCODERS actually work on this host
+        
+        Distro builds compile in encoders for devices that aren't there, so
+        each compiled-in encoder gets a one-frame test encode, once per process.
+        """
+        return {name: spec['encoder'] in self.encoders and self._hw_encoder_works(spec)
+                for name, spec in self.HW_ENCODERS.items()}
+    
+    def _hw_encoder_works(self, spec):
+        """Encode a single blank frame with spec's encoder"""
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'color=s=256x256',
+                 '-frames:v', '1', *spec['probe'], '-c:v', spec['encoder'], '-f', 'null', '-'],
+                stdin=subprocess.DEVNULL, capture_output=True, timeout=10
+            )
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return False
+        # Some builds exit 0 after failing to open an encoder; any error output counts
+        return result.returncode == 0 and not result.stderr.strip()
     
-    def convert_video(self, input_path, output_format='mp4', quality='medium', resolution=None):
-        """Convert video to specified format and quality"""
+    def convert_video(self, input_path, output_format='mp4', quality=None, resolution=None,
+                      preset=DEFAULT_X264_PRESET, hw_accel='auto', stdout_pipe=False):
+        """Convert video to specified format and quality
+        
+        quality defaults to 'medium'. When neither quality nor resolution is
+        given, sources already H.264/AAC are remuxed into MP4 instead, with a
+        re-encode as fallback if the stream copy fails. With stdout_pipe the
+        result is streamed instead of written to disk; see _execute for the
+        returned iterator.
+        """
         if not self.ffmpeg_available:
             raise Exception("FFmpeg is not available")
         
         output_path = self._get_output_path(input_path, output_format)
+        target = self._target(output_path, output_format, stdout_pipe)
+        
+        remux = output_format == 'mp4' and not quality and not resolution and self._is_mp4_compatible(input_path)
+        quality = quality or 'medium'
+        output_args, hw = self._convert_options(output_format, quality, resolution, preset, hw_accel)
+        
+        # Source already matches the target: remux instead of re-encoding
+        if remux:
+            attempts = [('copy', ['-i', input_path, '-c:v', 'copy', '-c:a', 'copy', *target]),
+                        *self._transcode_attempts([(input_path, target)], output_args, hw)]
+            stream = self._execute(attempts, stdout_pipe)
+            return stream if stdout_pipe else output_path
+        
+        # PyNvVideoCodec keeps NVDEC/NVENC busier than ffmpeg's own hwaccel path;
+        # it only handles the video stream at native resolution, and re-times
+        # frames at a fixed rate, so variable frame rate sources stay on FFmpeg
+        if (nvc is not None and hw and hw[0][0] == 'nvenc' and not resolution and not stdout_pipe
+                and (self.get_video_info(input_path) or {}).get('constant_frame_rate')):
+            crf = self.QUALITY_SETTINGS.get(quality, (23, None))[0]
+            try:
+                self._nvc_transcode(input_path, output_path, self.HW_CQ[crf])
+                return output_path
+            except Exception as e:
+                print(f"PyNvVideoCodec transcoding failed, falling back to FFmpeg: {e}")
         
-        # Build FFmpeg stream
-        stream = ffmpeg.input(input_path)
+        stream = self._transcode([(input_path, target)], output_args, hw, stdout_pipe)
+        
+        return stream if stdout_pipe else output_path
+    
+    def batch_convert(self, input_paths, output_format='mp4', quality='medium', resolution=None,
+                      preset=DEFAULT_X264_PRESET, hw_accel='auto'):
+        """Convert several videos with a single FFmpeg invocation"""
+        if not self.ffmpeg_available:
+            raise Exception("FFmpeg is not available")
+        
+        output_paths = [self._get_output_path(path, output_format) for path in input_paths]
+        
+        output_args, hw = self._convert_options(output_format, quality, resolution, preset, hw_accel)
+        self._transcode([(path, [output]) for path, output in zip(input_paths, output_paths)], output_args, hw)
+        
+        return output_paths
+    
+    def _is_mp4_compatible(self, input_path):
+        """Check whether the input's streams can be copied into MP4 unchanged"""
+        info = self.get_video_info(input_path)
+        return bool(info) and info.get('video_codec') == 'h264' and info.get('audio_codec') in (None, 'aac', 'mp3')
+    
+    def _convert_options(self, output_format, quality, resolution, preset, hw_accel):
+        """Build CPU output arguments and (if usable) a hardware encoder setup"""
+        video_args = []
+        audio_args = []
         
         # Quality settings
-        video_opts = {}
-        audio_opts = {}
-        
-        if quality == 'high':
-            video_opts['crf'] = 18
-            audio_opts['audio_bitrate'] = '320k'
-        elif quality == 'medium':
-            video_opts['crf'] = 23
-            audio_opts['audio_bitrate'] = '192k'
-        elif quality == 'low':
-            video_opts['crf'] = 28
-            audio_opts['audio_bitrate'] = '128k'
+        crf = None
+        if quality in self.QUALITY_SETTINGS:
+            crf, audio_bitrate = self.QUALITY_SETTINGS[quality]
+            video_args += ['-crf', str(crf)]
+            audio_args += ['-b:a', audio_bitrate]
         
-        # Resolution scaling
-        if resolution:
-            if resolution == '720p':
-                video_opts['vf'] = 'scale=-2:720'
-            elif resolution == '1080p':
-                video_opts['vf'] = 'scale=-2:1080'
-            elif resolution == '480p':
-                video_opts['vf'] = 'scale=-2:480'
-        
-        # Apply settings and run conversion
-        stream = ffmpeg.output(stream, output_path, **video_opts, **audio_opts)
-        ffmpeg.run(stream, overwrite_output=True, quiet=True)
+        if output_format in self.H264_CONTAINERS:
+            video_args += ['-preset', preset]
         
-        return output_path
+        # Resolution scaling
+        height = {'480p': 480, '720p': 720, '1080p': 1080}.get(resolution)
+        if height:
+            video_args += ['-vf', f'scale=-2:{height}']
+        
+        hw = []
+        if output_format in self.H264_CONTAINERS:
+            hw = self._hw_options(hw_accel, 'convert', self.HW_CQ.get(crf))
+        for name, _, hw_output_args in hw:
+            if height:
+                # Scale on the device; CPU scale would force a download/upload per frame
+                hw_output_args += ['-vf', self.HW_ENCODERS[name]['scale'].format(height=height)]
+            hw_output_args += audio_args
+        
+        return video_args + audio_args, hw
+    
+    def _select_hw_accel(self, hw_accel='auto'):
+        """Resolve a hw_accel request ('auto', 'none', or an encoder name) to working encoders
+        
+        'auto' gives every working encoder in order of preference, so a failed
+        run falls through to the next device before the CPU.
+        """
+        if hw_accel == 'auto':
+            return [name for name, works in self.hw_encoders.items() if works]
+        return [hw_accel] if self.hw_encoders.get(hw_accel) else []
+    
+    def _hw_options(self, hw_accel, operation, quality_value):
+        """Return a (name, input_args, output_args) setup per selected hardware encoder"""
+        setups = []
+        for name in self._select_hw_accel(hw_accel):
+            spec = self.HW_ENCODERS[name]
+            output_args = list(spec['output'])
+            if spec['presets']:
+                output_args += ['-preset', spec['presets'][operation]]
+            if quality_value is not None:
+                output_args += [spec['quality'], str(quality_value)]
+            setups.append((name, list(spec['input']), output_args))
+        return setups
     
-    def extract_audio(self, input_path, output_format='mp3', quality='192k'):
-        """Extract audio from video"""
+    def extract_audio(self, input_path, output_format='mp3', quality=None, stdout_pipe=False):
+        """Extract audio from video
+        
+        quality is an optional bitrate such as '192k'. Without it MP3 uses VBR
+        (-q:a 2) and AAC 192k, and AAC sources going to m4a/aac are copied as-is.
+        """
         if not self.ffmpeg_available:
             raise Exception("FFmpeg is not available")
         
         output_path = self._get_output_path(input_path, output_format)
         
-        stream = ffmpeg.input(input_path)
-        stream = ffmpeg.output(stream, output_path, acodec='libmp3lame', audio_bitrate=quality)
-        ffmpeg.run(stream, overwrite_output=True, quiet=True)
+        if output_format in ('m4a', 'aac'):
+            source_codec = (self.get_video_info(input_path) or {}).get('audio_codec')
+            if source_codec == 'aac' and not quality:
+                codec_args = ['-c:a', 'copy']
+            else:
+                codec_args = ['-c:a', 'aac', '-b:a', quality or '192k']
+        elif output_format == 'mp3':
+            codec_args = ['-c:a', 'libmp3lame', *(['-b:a', quality] if quality else ['-q:a', '2'])]
+        else:
+            # Let ffmpeg pick the container's default encoder (wav, ogg, flac, ...)
+            codec_args = ['-b:a', quality] if quality else []
+        
+        target = self._target(output_path, output_format, stdout_pipe)
+        stream = self._execute([('audio', ['-i', input_path, '-vn', *codec_args, *self.thread_args, *target])],
+                               stdout_pipe)
         
-        return output_path
+        return stream if stdout_pipe else output_path
     
-    def compress_video(self, input_path, compression_level='medium'):
-        """Compress video file"""
+    def compress_video(self, input_path, compression_level='medium', preset=None, hw_accel='auto',
+                       stdout_pipe=False):
+        """Compress video file
+        
+        preset overrides the level's default libx264 preset (see COMPRESS_SETTINGS).
+        """
         if not self.ffmpeg_available:
             raise Exception("FFmpeg is not available")
         
         output_path = self._get_output_path(input_path, 'mp4', suffix='_compressed')
         
         # Compression settings
-        crf_values = {'low': 35, 'medium': 28, 'high': 23}
-        crf = crf_values.get(compression_level, 28)
+        crf, level_preset = self.COMPRESS_SETTINGS.get(compression_level, self.COMPRESS_SETTINGS['medium'])
+        preset = preset or level_preset
         
-        stream = ffmpeg.input(input_path)
-        stream = ffmpeg.output(stream, output_path, crf=crf, preset='medium')
-        ffmpeg.run(stream, overwrite_output=True, quiet=True)
+        hw_quality = self.HW_COMPRESS_QUALITY.get(compression_level, 28)
+        hw = self._hw_options(hw_accel, 'compress', hw_quality)
         
-        return output_path
+        target = self._target(output_path, 'mp4', stdout_pipe)
+        stream = self._transcode([(input_path, target)], ['-crf', str(crf), '-preset', preset], hw, stdout_pipe)
+        
+        return stream if stdout_pipe else output_path
     
-    def trim_video(self, input_path, start_time, duration):
+    def trim_video(self, input_path, start_time, duration, stdout_pipe=False):
         """Trim video to specified duration"""
         if not self.ffmpeg_available:
             raise Exception("FFmpeg is not available")
         
         output_path = self._get_output_path(input_path, 'mp4', suffix='_trimmed')
         
-        stream = ffmpeg.input(input_path, ss=start_time, t=duration)
-        stream = ffmpeg.output(stream, output_path, c='copy')
-        ffmpeg.run(stream, overwrite_output=True, quiet=True)
+        if stdout_pipe:
+            target = self._target(output_path, 'mp4', stdout_pipe)
+            return self._execute([('trim', self._trim_args([(input_path, start_time, duration, target)]))], True)
+        
+        self.trim_many([(input_path, start_time, duration, output_path)])
         
         return output_path
     
-    def merge_videos(self, video_paths, output_format='mp4'):
+    def trim_many(self, jobs):
+        """Stream-copy several trims in one FFmpeg invocation
+        
+        jobs is a list of (input_path, start_time, duration, output_path);
+        process start-up and demuxer setup are paid once for the whole batch.
+        """
+        if not self.ffmpeg_available:
+            raise Exception("FFmpeg is not available")
+        
+        self._run(self._trim_args([(*job[:3], [job[3]]) for job in jobs]))
+    
+    def _trim_args(self, jobs):
+        """Build ffmpeg arguments for (input, start, duration, output_target) jobs"""
+        args = []
+        for input_path, start_time, duration, _ in jobs:
+            args += ['-ss', str(start_time), '-t', str(duration), '-i', input_path]
+        for i, (_, _, _, target) in enumerate(jobs):
+            args += ['-map', f'{i}:v:0?', '-map', f'{i}:a:0?', '-c', 'copy', *target]
+        return args
+    
+    def merge_videos(self, video_paths, output_format='mp4', stdout_pipe=False):
         """Merge multiple videos into one"""
         if not self.ffmpeg_available:
             raise Exception("FFmpeg is not available")
@@ -136,89 +793,537 @@ class FFmpegProcessor:
             raise Exception("At least 2 videos required for merging")
         
         output_path = os.path.join(TEMP_DIR, f'merged_video_{int(time.time())}.{output_format}')
+        target = self._target(output_path, output_format, stdout_pipe)
+        attempts = []
+        
+        # Inputs with identical stream parameters can be joined by the concat
+        # demuxer without re-encoding; its file list is fed through stdin. The
+        # entries need an explicit file: scheme, as relative to pipe:0 they
+        # would otherwise resolve to pipe:<path>
+        if self._same_stream_params(video_paths):
+            script = ''.join(f"file 'file:{self._concat_quote(path)}'\n" for path in video_paths)
+            attempts.append(('concat copy', [
+                '-f', 'concat', '-safe', '0', '-protocol_whitelist', 'file,pipe', '-i', 'pipe:0',
+                '-map', '0:v:0?', '-map', '0:a:0?', '-c', 'copy', *target
+            ], script))
+        
+        # Otherwise concatenate the decoded video and audio of every input
+        args = []
+        for path in video_paths:
+            args += ['-i', path]
+        streams = ''.join(f'[{i}:v][{i}:a]' for i in range(len(video_paths)))
+        args += [
+            '-filter_complex', f'{streams}concat=n={len(video_paths)}:v=1:a=1[v][a]',
+            '-map', '[v]', '-map', '[a]', *self.thread_args, *target
+        ]
+        attempts.append(('concat filter', args))
         
-        # Create input streams
-        inputs = [ffmpeg.input(path) for path in video_paths]
-        
-        # Concatenate videos
-        stream = ffmpeg.concat(*inputs, v=1, a=1)
-        stream = ffmpeg.output(stream, output_path)
-        ffmpeg.run(stream, overwrite_output=True, quiet=True)
+        stream = self._execute(attempts, stdout_pipe)
         
-        return output_path
+        return stream if stdout_pipe else output_path
+    
+    def _same_stream_params(self, video_paths):
+        """Whether every input has the same codecs, dimensions, frame rate and audio layout"""
+        keys = ('video_codec', 'width', 'height', 'fps', 'audio_codec', 'sample_rate', 'channels')
+        signatures = set()
+        for path in video_paths:
+            info = self.get_video_info(path)
+            if not info or not info.get('video_codec'):
+                return False
+            signatures.add(tuple(info.get(key) for key in keys))
+        return len(signatures) == 1
+    
+    @staticmethod
+    def _concat_quote(path):
+        # Inside single quotes the concat script only needs ' escaped
+        return path.replace("'", "'\\''")
     
-    def add_watermark(self, input_path, watermark_text, position='bottom-right'):
+    def add_watermark(self, input_path, watermark_text, position='bottom-right', stdout_pipe=False):
         """Add text watermark to video"""
         if not self.ffmpeg_available:
             raise Exception("FFmpeg is not available")
         
         output_path = self._get_output_path(input_path, 'mp4', suffix='_watermarked')
         
-        # Position mapping
-        positions = {
-            'top-left': 'x=10:y=10',
-            'top-right': 'x=w-tw-10:y=10',
-            'bottom-left': 'x=10:y=h-th-10',
-            'bottom-right': 'x=w-tw-10:y=h-th-10',
-            'center': 'x=(w-tw)/2:y=(h-th)/2'
-        }
+        drawtext = self.WATERMARK_FILTERS.get(position, self.WATERMARK_FILTERS['bottom-right'])
         
-        position_coords = positions.get(position, positions['bottom-right'])
+        # The text is read from a file so it never has to be escaped into the
+        # filter graph, and expansion is disabled so '%{...}' stays literal
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as text_file:
+            text_file.write(watermark_text)
         
-        stream = ffmpeg.input(input_path)
-        stream = ffmpeg.output(
-            stream, output_path,
-            vf=f"drawtext=text='{watermark_text}':fontcolor=white:fontsize=24:{position_coords}"
-        )
-        ffmpeg.run(stream, overwrite_output=True, quiet=True)
+        args = [
+            '-i', input_path,
+            '-vf', drawtext.format(textfile=text_file.name),
+            *self.thread_args, *self._target(output_path, 'mp4', stdout_pipe)
+        ]
+        
+        if stdout_pipe:
+            # ffmpeg reads the text file once while building the filter graph
+            try:
+                return self._execute([('watermark', args)], True)
+            finally:
+                os.remove(text_file.name)
+        
+        try:
+            self._run(args)
+        finally:
+            os.remove(text_file.name)
         
         return output_path
     
-    def get_video_info(self, input_path):
-        """Get detailed video information using FFmpeg"""
+    def get_video_info(self, input_path, st=None):
+        """Get detailed video information using FFmpeg
+        
+        st is an optional os.stat result for input_path, for callers that
+        already have one. Results are cached until the file's mtime or size
+        changes.
+        """
         if not self.ffmpeg_available:
             return None
         
         try:
-            probe = ffmpeg.probe(input_path)
-            video_info = {}
-            
-            # General info
-            format_info = probe.get('format', {})
-            video_info['duration'] = float(format_info.get('duration', 0))
-            video_info['size'] = int(format_info.get('size', 0))
-            video_info['bit_rate'] = int(format_info.get('bit_rate', 0))
-            
-            # Video stream info
-            video_streams = [s for s in probe['streams'] if s['codec_type'] == 'video']
-            if video_streams:
-                v_stream = video_streams[0]
-                video_info['width'] = v_stream.get('width')
-                video_info['height'] = v_stream.get('height')
-                video_info['fps'] = eval(v_stream.get('r_frame_rate', '0/1'))
-                video_info['video_codec'] = v_stream.get('codec_name')
-            
-            # Audio stream info
-            audio_streams = [s for s in probe['streams'] if s['codec_type'] == 'audio']
-            if audio_streams:
-                a_stream = audio_streams[0]
-                video_info['audio_codec'] = a_stream.get('codec_name')
-                video_info['sample_rate'] = a_stream.get('sample_rate')
-                video_info['channels'] = a_stream.get('channels')
-            
-            return video_info
+            st = st or os.stat(input_path)
+            return dict(self._info_cache(input_path, st.st_mtime_ns, st.st_size))
         except Exception as e:
             print(f"Error getting video info: {e}")
             return None
     
+    def _video_info_impl(self, input_path, mtime_ns, size):
+        """Probe input_path and summarise the first video and audio streams"""
+        probe = self._probe_impl(input_path, mtime_ns, size)
+        video_info = {}
+        
+        # General info
+        format_info = probe.get('format', {})
+        video_info['duration'] = float(format_info.get('duration', 0))
+        video_info['size'] = int(format_info.get('size', 0))
+        video_info['bit_rate'] = int(format_info.get('bit_rate', 0))
+        
+        # Video stream info
+        video_streams = [s for s in probe['streams'] if s['codec_type'] == 'video']
+        if video_streams:
+            v_stream = video_streams[0]
+            video_info['width'] = v_stream.get('width')
+            video_info['height'] = v_stream.get('height')
+            video_info['fps'] = float(Fraction(v_stream.get('r_frame_rate', '0/1')))
+            # Variable frame rate sources report an average that differs from r_frame_rate
+            video_info['constant_frame_rate'] = (
+                not v_stream.get('avg_frame_rate', '0/0').endswith('/0')
+                and Fraction(v_stream['avg_frame_rate']) == Fraction(v_stream.get('r_frame_rate', '0/1'))
+            )
+            video_info['video_codec'] = v_stream.get('codec_name')
+        
+        # Audio stream info
+        audio_streams = [s for s in probe['streams'] if s['codec_type'] == 'audio']
+        if audio_streams:
+            a_stream = audio_streams[0]
+            video_info['audio_codec'] = a_stream.get('codec_name')
+            video_info['sample_rate'] = a_stream.get('sample_rate')
+            video_info['channels'] = a_stream.get('channels')
+        
+        return video_info
+    
+    def _probe_impl(self, input_path, mtime_ns, size):
+        """Run ffprobe; mtime_ns and size only serve as cache key components"""
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', input_path],
+            stdin=subprocess.DEVNULL, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise FFmpegError(result.stderr.strip() or f'ffprobe exited with status {result.returncode}')
+        return json.loads(result.stdout)
+    
+    def _transcode(self, jobs, output_args, hw=(), stdout_pipe=False):
+        """Encode every (input, output_target) pair in jobs with one FFmpeg invocation.
+        
+        The hardware setups from _hw_options are tried first, in order, keeping
+        decoded frames in device memory; if they all fail (e.g. the device
+        can't decode the source) the CPU output_args are used.
+        """
+        return self._execute(self._transcode_attempts(jobs, output_args, hw), stdout_pipe)
+    
+    def _transcode_attempts(self, jobs, output_args, hw=()):
+        """_execute attempts for _transcode: each hardware setup, then the CPU"""
+        attempts = []
+        for name, hw_input_args, hw_output_args in hw:
+            attempts.append((name, self._jobs_args(jobs, hw_output_args, hw_input_args)))
+        attempts.append(('cpu', self._jobs_args(jobs, output_args)))
+        return attempts
+    
+    def _nvc_transcode(self, input_path, output_path, cq):
+        """Re-encode the video stream with PyNvVideoCodec, remuxing audio with FFmpeg
+        
+        Decoded surfaces are handed straight to the encoder in device memory.
+        The resulting H.264 elementary stream is then muxed with the source
+        audio using a stream copy. The raw stream carries no timestamps, so
+        callers must only pass constant frame rate sources. A job slot is held
+        for the whole transcode, remux included.
+        """
+        bitstream_path = os.path.splitext(output_path)[0] + '.h264'
+        # Exact rate (e.g. 30000/1001) so long videos don't drift against the audio
+        fps = Fraction((self.get_video_info(input_path) or {}).get('fps') or 30).limit_denominator(1001)
+        
+        with self._job_slot():
+            demuxer = nvc.CreateDemuxer(filename=input_path)
+            decoder = nvc.CreateDecoder(gpuid=0, codec=demuxer.GetNvCodecId(),
+                                        cudacontext=0, cudastream=0, usedevicememory=True)
+            encoder = nvc.CreateEncoder(demuxer.Width(), demuxer.Height(), 'NV12', False,
+                                        codec='h264', preset='P4', tuning_info='high_quality',
+                                        rc='vbr', cq=str(cq), fps=str(round(float(fps))))
+            
+            try:
+                with open(bitstream_path, 'wb') as bitstream:
+                    for packet in demuxer:
+                        for frame in decoder.Decode(packet):
+                            bitstream.write(bytearray(encoder.Encode(frame)))
+                    bitstream.write(bytearray(encoder.EndEncode()))
+                
+                self._run([
+                    '-framerate', str(fps), '-i', bitstream_path, '-i', input_path,
+                    '-map', '0:v', '-map', '1:a?', '-c', 'copy', output_path
+                ])
+            finally:
+                if os.path.exists(bitstream_path):
+                    os.remove(bitstream_path)
+    
+    def _jobs_args(self, jobs, output_args, input_args=()):
+        """Build arguments for one FFmpeg process with an input/output mapping per job"""
+        args = []
+        for input_path, _ in jobs:
+            args += [*input_args, '-i', input_path]
+        for i, (_, target) in enumerate(jobs):
+            args += ['-map', f'{i}:v:0?', '-map', f'{i}:a:0?', *output_args, *self.thread_args, *target]
+        return args
+    
+    def _target(self, output_path, output_format, stdout_pipe=False):
+        """Trailing output arguments: the file path, or a muxer writing to stdout"""
+        if not stdout_pipe:
+            return [output_path]
+        if output_format not in self.PIPE_MUXERS:
+            raise Exception(f"Streaming is not supported for format: {output_format}")
+        return [*self.PIPE_MUXERS[output_format], 'pipe:1']
+    
+    def _execute(self, attempts, stdout_pipe=False):
+        """Run (label, args) or (label, args, stdin_text) attempts in order until one succeeds
+        
+        Without stdout_pipe returns None once the output file is written. With
+        it, returns an iterator over ffmpeg's stdout; startup failures are still
+        raised here (before any bytes are handed out) so fallbacks and error
+        responses keep working.
+        """
+        for i, (label, args, *stdin_text) in enumerate(attempts):
+            stdin_text = stdin_text[0] if stdin_text else None
+            try:
+                if stdout_pipe:
+                    return self._open_pipe(args, stdin_text)
+                self._run(args, stdin_text)
+                return None
+            except FFmpegError as e:
+                if i == len(attempts) - 1:
+                    raise
+                print(f"{label} failed, falling back to {attempts[i + 1][0]}: {e}")
+    
+    def _command(self, args):
+        threads = str(self.threads_per_job)
+        return ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                '-filter_threads', threads, '-filter_complex_threads', threads, *args]
+    
+    @contextlib.contextmanager
+    def _job_slot(self):
+        """Hold a file job slot for the block, yielding its core set
+        
+        Reentrant per thread: ffmpeg runs inside a block that already holds a
+        slot (e.g. the remux after a PyNvVideoCodec encode) reuse it rather
+        than waiting on a second one.
+        """
+        cores = getattr(self._held, 'cores', None)
+        if cores is not None:
+            yield cores
+            return
+        cores = self._core_sets.get()
+        self._held.cores = cores
+        try:
+            yield cores
+        finally:
+            self._held.cores = None
+            self._core_sets.put(cores)
+    
+    def _spawn(self, args, stdin_text=None, cores=None, **popen_kwargs):
+        """Start ffmpeg, pinned to cores when given
+        
+        Affinity is set right after exec rather than in preexec_fn, which is
+        unsafe with threads; ffmpeg starts its worker threads later, and they
+        inherit the mask.
+        """
+        stdin = subprocess.DEVNULL if stdin_text is None else subprocess.PIPE
+        proc = subprocess.Popen(self._command(args), stdin=stdin, **popen_kwargs)
+        if cores is not None and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(proc.pid, cores)
+            except OSError:
+                pass  # Already exited
+        return proc
+    
+    @contextlib.contextmanager
+    def report_progress(self, on_time):
+        """Within this block, ffmpeg runs on this thread call on_time(seconds of output written)"""
+        previous = getattr(self._progress, 'on_time', None)
+        self._progress.on_time = on_time
+        try:
+            yield
+        finally:
+            self._progress.on_time = previous
+    
+    def _run(self, args, stdin_text=None):
+        """Run ffmpeg with the given arguments, raising FFmpegError on failure"""
+        on_time = getattr(self._progress, 'on_time', None)
+        if on_time is not None:
+            return self._run_monitored(args, stdin_text, on_time)
+        
+        with self._job_slot() as cores:
+            proc = self._spawn(args, stdin_text, cores, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            try:
+                _, stderr = proc.communicate(stdin_text)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+        if proc.returncode != 0:
+            raise FFmpegError(stderr.strip() or f'ffmpeg exited with status {proc.returncode}')
+    
+    def _run_monitored(self, args, stdin_text, on_time):
+        """Like _run, with -stats progress on stderr parsed by STDERR_MONITOR"""
+        with self._job_slot() as cores:
+            proc = self._spawn(['-stats', *args], stdin_text, cores, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            try:
+                self._feed_stdin(proc, stdin_text)
+                watch = STDERR_MONITOR.watch(proc.stderr, on_time)
+                proc.wait()
+                watch.done.wait()
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+        if proc.returncode != 0:
+            raise FFmpegError(watch.error_text() or f'ffmpeg exited with status {proc.returncode}')
+    
+    def _feed_stdin(self, proc, stdin_text):
+        if stdin_text is None:
+            return
+        try:
+            proc.stdin.write(stdin_text.encode())
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its stderr says why
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+    
+    def _open_pipe(self, args, stdin_text=None):
+        """Start ffmpeg writing to stdout and wait for its first chunk of output
+        
+        Streams take a stream slot plus a pinned job slot, waiting at most
+        queue_timeout for them, and release both as soon as ffmpeg exits or
+        the returned iterator is closed, whichever comes first; a client that
+        stops reading mid-download doesn't hold them past ffmpeg's own exit.
+        stdin_text (e.g. a concat list) must be small
+        enough to fit the pipe buffer, since it is written before any output
+        is read. stderr is drained by STDERR_MONITOR while stdout streams, so
+        an error-heavy input can't fill the pipe and deadlock ffmpeg against
+        the reader.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        if not self._stream_slots.acquire(timeout=self.queue_timeout):
+            raise FFmpegBusyError('Too many streams in progress, try again later')
+        try:
+            cores = self._core_sets.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            self._stream_slots.release()
+            raise FFmpegBusyError('All FFmpeg job slots are busy, try again later') from None
+        release_lock = threading.Lock()
+        released = False
+        
+        def release():
+            nonlocal released
+            with release_lock:
+                if released:
+                    return
+                released = True
+            self._core_sets.put(cores)
+            self._stream_slots.release()
+        
+        try:
+            proc = self._spawn(args, stdin_text, cores, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except BaseException:
+            release()
+            raise
+        watch = STDERR_MONITOR.watch(proc.stderr, on_done=release)
+        self._feed_stdin(proc, stdin_text)
+        first_chunk = proc.stdout.read1(self.PIPE_CHUNK_SIZE)
+        if not first_chunk:
+            proc.wait()
+            watch.done.wait()
+            proc.stdout.close()
+            if proc.returncode != 0:
+                raise FFmpegError(watch.error_text() or f'ffmpeg exited with status {proc.returncode}')
+            return iter(())
+        
+        stream = self._iter_pipe(proc, release, first_chunk)
+        # Step into the try block so close() cleans up even if never iterated
+        next(stream)
+        return stream
+    
+    def _iter_pipe(self, proc, release, first_chunk):
+        """Yield ffmpeg's stdout; killing it if the consumer stops early"""
+        try:
+            yield
+            yield first_chunk
+            while chunk := proc.stdout.read1(self.PIPE_CHUNK_SIZE):
+                yield chunk
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            proc.stdout.close()
+            release()
+    
+    def process(self, input_path, action, opts, stdout_pipe=False):
+        """Run one processing action ('compress', 'convert', ...) configured by a ProcessOpts"""
+        if action == 'compress':
+            return self.compress_video(input_path, opts.level, opts.preset, opts.hw_accel, stdout_pipe=stdout_pipe)
+        if action == 'extract_audio':
+            return self.extract_audio(input_path, opts.audio_format, opts.quality, stdout_pipe=stdout_pipe)
+        if action == 'convert':
+            return self.convert_video(input_path, opts.video_format, opts.quality, opts.resolution,
+                                      opts.preset or self.DEFAULT_X264_PRESET, opts.hw_accel, stdout_pipe=stdout_pipe)
+        if action == 'trim':
+            return self.trim_video(input_path, opts.start_time, opts.duration, stdout_pipe=stdout_pipe)
+        if action == 'watermark':
+            return self.add_watermark(input_path, opts.text, opts.position, stdout_pipe=stdout_pipe)
+        raise ValueError(f'Unknown processing action: {action}')
+    
     def _get_output_path(self, input_path, output_format, suffix='_processed'):
         """Generate output file path"""
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         return os.path.join(TEMP_DIR, f'{base_name}{suffix}.{output_format}')
 
+@dataclass(frozen=True, slots=True)
+class ProcessOpts:
+    """Options for FFmpegProcessor.process, parsed once per request
+    
+    format, quality and preset default per action (mp3 / VBR for audio, mp4 /
+    medium / DEFAULT_X264_PRESET for conversion, the level's preset for
+    compression), so they are None until a client sets them.
+    """
+    
+    level: str = 'medium'
+    preset: str | None = None
+    hw_accel: str = 'auto'
+    format: str | None = None
+    quality: str | None = None
+    resolution: str | None = None
+    start_time: str = '00:00:00'
+    duration: str = '00:01:00'
+    text: str = 'Processed Video'
+    position: str = 'bottom-right'
+    
+    ACTIONS = ('compress', 'extract_audio', 'convert', 'trim', 'watermark')
+    
+    @classmethod
+    def from_dict(cls, options):
+        """Build from a request's options, ignoring keys that aren't options (e.g. 'action')"""
+        names = {field.name for field in fields(cls)}
+        return cls(**{k: v for k, v in (options or {}).items() if k in names})
+    
+    @property
+    def audio_format(self):
+        return self.format or 'mp3'
+    
+    @property
+    def video_format(self):
+        return self.format or 'mp4'
+    
+    def download_name(self, action, stem):
+        """File name a client receives for action applied to a file named stem"""
+        return {
+            'compress': f'{stem}_compressed.mp4',
+            'extract_audio': f'{stem}_processed.{self.audio_format}',
+            'convert': f'{stem}_processed.{self.video_format}',
+            'trim': f'{stem}_trimmed.mp4',
+            'watermark': f'{stem}_watermarked.mp4'
+        }[action]
+
+class TrimBatcher:
+    """Coalesces concurrent trim requests into shared FFmpeg invocations
+    
+    Requests arriving within `window` seconds of the first pending one are run
+    together through FFmpegProcessor.trim_many. Jobs that would write the same
+    output file are held back for the next batch.
+    """
+    
+    def __init__(self, processor, window=0.05):
+        self.processor = processor
+        self.window = window
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+    
+    def trim(self, input_path, start_time, duration):
+        """Trim a video, blocking until its batch has run; returns the output path"""
+        output_path = self.processor._get_output_path(input_path, 'mp4', suffix='_trimmed')
+        job = {
+            'args': (input_path, start_time, duration, output_path),
+            'done': threading.Event(),
+            'error': None
+        }
+        
+        with self._lock:
+            self._pending.append(job)
+            self._arm()
+        
+        job['done'].wait()
+        if job['error']:
+            raise job['error']
+        return output_path
+    
+    def _arm(self):
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(self.window, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def _flush(self):
+        with self._lock:
+            batch, deferred, outputs = [], [], set()
+            for job in self._pending:
+                output_path = job['args'][3]
+                (deferred if output_path in outputs else batch).append(job)
+                outputs.add(output_path)
+            self._pending = deferred
+            self._timer = None
+            self._arm()
+        
+        try:
+            self.processor.trim_many([job['args'] for job in batch])
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0]['error'] = error
+            else:
+                # One bad input fails the shared invocation; isolate it
+                for job in batch:
+                    try:
+                        self.processor.trim_many([job['args']])
+                    except Exception as e:
+                        job['error'] = e
+        
+        for job in batch:
+            job['done'].set()
+
 class AdvancedSocialMediaDownloader:
     def __init__(self):
         self.ffmpeg_processor = FFmpegProcessor()
+        self.aria2c_available = shutil.which('aria2c') is not None
         self.supported_platforms = {
             'youtube.com': 'YouTube',
             'youtu.be': 'YouTube',
@@ -234,6 +1339,9 @@ class AdvancedSocialMediaDownloader:
             'soundcloud.com': 'SoundCloud'
         }
         
+        # Longest domains first so the most specific suffix wins
+        self._domain_suffixes = tuple(sorted(self.supported_platforms.items(), key=lambda kv: -len(kv[0])))
+        
         self.format_presets = {
             'best_video': 'best[ext=mp4]/best',
             'best_audio': 'bestaudio[ext=m4a]/bestaudio',
@@ -259,26 +1367,16 @@ class AdvancedSocialMediaDownloader:
         }
     
     def get_platform(self, url):
-        domain = urlparse(url).netloc.lower()
-        for platform_domain, platform_name in self.supported_platforms.items():
-            if platform_domain in domain:
-                return platform_name
-        return 'Unknown'
+        domain = urlparse(url).netloc.lower().split(':')[0]
+        return next((name for suffix, name in self._domain_suffixes
+                     if domain == suffix or domain.endswith('.' + suffix)), 'Unknown')
     
     def validate_url(self, url):
         """Enhanced URL validation"""
         if not url or not isinstance(url, str):
             return False, "URL is required"
         
-        url_pattern = re.compile(
-            r'^https?://'
-            r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'
-            r'localhost|'
-            r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
-            r'(?::\d+)?'
-            r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-        
-        if not url_pattern.match(url):
+        if not URL_PATTERN.match(url):
             return False, "Invalid URL format"
         
         # Check if platform is supported
@@ -288,6 +1386,29 @@ class AdvancedSocialMediaDownloader:
         
         return True, "Valid URL"
     
+    @staticmethod
+    def _upload_date(info):
+        """YYYYMMDD upload date, derived from the timestamp when yt-dlp's
+        processing step (skipped for basic metadata) hasn't filled it in"""
+        if info.get('upload_date'):
+            return info['upload_date']
+        timestamp = info.get('timestamp') or info.get('release_timestamp')
+        if timestamp is None:
+            return ''
+        try:
+            return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+        except (OverflowError, OSError, ValueError, TypeError):
+            return ''
+    
+    @staticmethod
+    def _thumbnail(info):
+        """Thumbnail URL, falling back like yt-dlp's processing step to the
+        last (best) entry of 'thumbnails' when only the list is reported"""
+        if info.get('thumbnail'):
+            return info['thumbnail']
+        thumbnails = [t for t in info.get('thumbnails') or () if t.get('url')]
+        return thumbnails[-1]['url'] if thumbnails else ''
+    
     def get_video_info(self, url, include_formats=True):
         """Enhanced video information extraction"""
         ydl_opts = {
@@ -298,9 +1419,18 @@ class AdvancedSocialMediaDownloader:
             'writeautomaticsub': False
         }
         
+        # Basic metadata only: skip yt-dlp's format processing and don't
+        # resolve individual playlist entries
+        if not include_formats:
+            ydl_opts['extract_flat'] = 'in_playlist'
+        
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+                info = ydl.extract_info(url, download=False, process=include_formats)
+                
+                # Unprocessed results may just point at another extractor
+                if info.get('_type') in ('url', 'url_transparent'):
+                    info = ydl.extract_info(url, download=False)
                 
                 # Extract comprehensive information
                 video_info = {
@@ -310,11 +1440,11 @@ class AdvancedSocialMediaDownloader:
                     'duration': info.get('duration', 0),
                     'uploader': info.get('uploader', 'Unknown'),
                     'uploader_id': info.get('uploader_id', ''),
-                    'upload_date': info.get('upload_date', ''),
+                    'upload_date': self._upload_date(info),
                     'view_count': info.get('view_count', 0),
                     'like_count': info.get('like_count', 0),
                     'comment_count': info.get('comment_count', 0),
-                    'thumbnail': info.get('thumbnail', ''),
+                    'thumbnail': self._thumbnail(info),
                     'platform': self.get_platform(url),
                     'webpage_url': info.get('webpage_url', url),
                     'tags': info.get('tags', [])[:10] if info.get('tags') else [],
@@ -335,75 +1465,86 @@ class AdvancedSocialMediaDownloader:
     
     def _get_available_formats(self, info):
         """Enhanced format extraction with categorization"""
-        formats = {
+        buckets = {
             'video': [],
             'audio': [],
             'combined': []
         }
         
-        if 'formats' in info:
-            for fmt in info['formats']:
-                format_info = {
-                    'format_id': fmt.get('format_id'),
-                    'ext': fmt.get('ext'),
-                    'quality': fmt.get('height', fmt.get('quality', 'unknown')),
-                    'filesize': fmt.get('filesize', 0),
-                    'filesize_approx': fmt.get('filesize_approx', 0),
-                    'fps': fmt.get('fps'),
-                    'vcodec': fmt.get('vcodec', 'none'),
-                    'acodec': fmt.get('acodec', 'none'),
-                    'abr': fmt.get('abr'),  # Audio bitrate
-                    'vbr': fmt.get('vbr'),  # Video bitrate
-                    'format_note': fmt.get('format_note', ''),
-                    'resolution': fmt.get('resolution', 'unknown')
-                }
-                
-                # Categorize formats
-                if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none':
-                    formats['combined'].append(format_info)
-                elif fmt.get('vcodec') != 'none':
-                    formats['video'].append(format_info)
-                elif fmt.get('acodec') != 'none':
-                    formats['audio'].append(format_info)
-        
-        # Limit results and sort by quality
-        for category in formats:
-            formats[category] = sorted(formats[category][:15], 
-                                     key=lambda x: x.get('quality', 0) if isinstance(x.get('quality'), int) else 0, 
-                                     reverse=True)
+        # Classify raw formats first; dicts are only built for the survivors
+        for fmt in info.get('formats') or []:
+            quality = fmt.get('height', fmt.get('quality', 'unknown'))
+            sort_key = quality if isinstance(quality, int) else 0
+            
+            if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none':
+                buckets['combined'].append((sort_key, quality, fmt))
+            elif fmt.get('vcodec') != 'none':
+                buckets['video'].append((sort_key, quality, fmt))
+            elif fmt.get('acodec') != 'none':
+                buckets['audio'].append((sort_key, quality, fmt))
+        
+        # Keep the 15 highest quality formats per category
+        formats = {}
+        for category, bucket in buckets.items():
+            formats[category] = [
+                self._format_info(fmt, quality)
+                for _, quality, fmt in heapq.nlargest(15, bucket, key=lambda entry: entry[0])
+            ]
         
         return formats
     
-    def download_video(self, url, format_selector='best', task_id=None, download_subtitles=False, post_process=None):
-        """Enhanced download with FFmpeg post-processing"""
+    def _format_info(self, fmt, quality):
+        return {
+            'format_id': fmt.get('format_id'),
+            'ext': fmt.get('ext'),
+            'quality': quality,
+            'filesize': fmt.get('filesize', 0),
+            'filesize_approx': fmt.get('filesize_approx', 0),
+            'fps': fmt.get('fps'),
+            'vcodec': fmt.get('vcodec', 'none'),
+            'acodec': fmt.get('acodec', 'none'),
+            'abr': fmt.get('abr'),  # Audio bitrate
+            'vbr': fmt.get('vbr'),  # Video bitrate
+            'format_note': fmt.get('format_note', ''),
+            'resolution': fmt.get('resolution', 'unknown')
+        }
+    
+    def download_video(self, url, format_selector='best', task_id=None, download_subtitles=False, post_process=None,
+                       defer_post_process=False):
+        """Enhanced download with FFmpeg post-processing
+        
+        With defer_post_process the raw download is returned and the caller is
+        responsible for applying post_process (used to batch FFmpeg runs).
+        """
         if task_id:
-            DOWNLOAD_TASKS[task_id] = {
+            DOWNLOAD_TASKS.set(task_id, {
                 'status': 'starting',
                 'progress': 0,
                 'filename': '',
                 'error': None,
                 'start_time': datetime.now().isoformat(),
                 'post_processing': post_process is not None
-            }
+            })
         
         def progress_hook(d):
-            if task_id and task_id in DOWNLOAD_TASKS:
+            if task_id:
                 if d['status'] == 'downloading':
                     try:
                         percent = d.get('_percent_str', '0%').replace('%', '')
-                        DOWNLOAD_TASKS[task_id]['progress'] = float(percent) * 0.7  # Reserve 30% for post-processing
-                        DOWNLOAD_TASKS[task_id]['status'] = 'downloading'
-                        DOWNLOAD_TASKS[task_id]['filename'] = d.get('filename', '')
+                        DOWNLOAD_TASKS.update(
+                            task_id,
+                            progress=float(percent) * 0.7,  # Reserve 30% for post-processing
+                            status='downloading',
+                            filename=d.get('filename', '')
+                        )
                     except (ValueError, TypeError):
                         pass
                 elif d['status'] == 'finished':
                     if post_process:
-                        DOWNLOAD_TASKS[task_id]['status'] = 'post_processing'
-                        DOWNLOAD_TASKS[task_id]['progress'] = 70
+                        DOWNLOAD_TASKS.update(task_id, status='post_processing', progress=70)
                     else:
-                        DOWNLOAD_TASKS[task_id]['status'] = 'finished'
-                        DOWNLOAD_TASKS[task_id]['progress'] = 100
-                    DOWNLOAD_TASKS[task_id]['filename'] = d.get('filename', '')
+                        DOWNLOAD_TASKS.update(task_id, status='finished', progress=100)
+                    DOWNLOAD_TASKS.update(task_id, filename=d.get('filename', ''))
         
         output_path = os.path.join(TEMP_DIR, '%(title)s.%(ext)s')
         
@@ -415,9 +1556,20 @@ class AdvancedSocialMediaDownloader:
             'progress_hooks': [progress_hook] if task_id else [],
             'writesubtitles': download_subtitles,
             'writeautomaticsub': download_subtitles,
-            'subtitleslangs': ['en', 'en-US', 'en-GB'] if download_subtitles else []
+            'subtitleslangs': ['en', 'en-US', 'en-GB'] if download_subtitles else [],
+            # Fetch DASH/HLS fragments in parallel
+            'concurrent_fragment_downloads': 8
         }
         
+        # Split progressive (single-file) HTTP downloads across several connections.
+        # yt-dlp reports no byte progress for external downloaders, so tracked
+        # tasks keep the native downloader and its progress hooks
+        if self.aria2c_available and not task_id:
+            ydl_opts['external_downloader'] = {'http': 'aria2c'}
+            ydl_opts['external_downloader_args'] = {
+                'aria2c': ['-x', '16', '-k', '1M', '--file-allocation=none', '--summary-interval=0']
+            }
+        
         # Add FFmpeg post-processing if available
         if self.ffmpeg_processor.ffmpeg_available and not post_process:
             ydl_opts['postprocessors'] = [{
@@ -432,65 +1584,51 @@ class AdvancedSocialMediaDownloader:
                 title = info.get('title', 'download')
                 
                 # Apply custom post-processing if specified
-                if post_process and self.ffmpeg_processor.ffmpeg_available:
+                if post_process and not defer_post_process and self.ffmpeg_processor.ffmpeg_available:
                     if task_id:
-                        DOWNLOAD_TASKS[task_id]['status'] = 'post_processing'
-                        DOWNLOAD_TASKS[task_id]['progress'] = 75
+                        DOWNLOAD_TASKS.update(task_id, status='post_processing', progress=75)
+                    
+                    duration = (self.ffmpeg_processor.get_video_info(filename) or {}).get('duration')
+                    on_time = (functools.partial(self._post_process_progress, task_id, duration)
+                               if task_id and duration else None)
                     
-                    processed_filename = self._apply_post_processing(filename, post_process)
+                    processed_filename = self._apply_post_processing(filename, post_process, on_time)
                     
                     if task_id:
-                        DOWNLOAD_TASKS[task_id]['progress'] = 100
-                        DOWNLOAD_TASKS[task_id]['status'] = 'completed'
-                        DOWNLOAD_TASKS[task_id]['filename'] = processed_filename
+                        DOWNLOAD_TASKS.update(task_id, progress=100, status='completed', filename=processed_filename)
                     
                     return processed_filename, title
                 
                 if task_id:
-                    DOWNLOAD_TASKS[task_id]['status'] = 'completed'
-                    DOWNLOAD_TASKS[task_id]['filename'] = filename
-                    DOWNLOAD_TASKS[task_id]['progress'] = 100
+                    DOWNLOAD_TASKS.update(task_id, status='completed', filename=filename, progress=100)
                 
                 return filename, title
         except Exception as e:
             if task_id:
-                DOWNLOAD_TASKS[task_id]['status'] = 'error'
-                DOWNLOAD_TASKS[task_id]['error'] = str(e)
+                DOWNLOAD_TASKS.update(task_id, status='error', error=str(e))
             raise Exception(f"Error downloading video: {str(e)}")
     
-    def _apply_post_processing(self, filename, post_process_config):
-        """Apply FFmpeg post-processing based on configuration"""
+    @staticmethod
+    def _post_process_progress(task_id, duration, seconds):
+        """Map FFmpeg's output position onto the 75-100% band of the task's progress"""
+        DOWNLOAD_TASKS.update(task_id, progress=75 + 25 * min(1.0, seconds / duration))
+    
+    def _apply_post_processing(self, filename, post_process_config, on_time=None):
+        """Apply FFmpeg post-processing based on configuration
+        
+        on_time, if given, receives FFmpeg's progress in seconds of output.
+        """
         try:
             action = post_process_config.get('action')
-            
-            if action == 'compress':
-                level = post_process_config.get('level', 'medium')
-                return self.ffmpeg_processor.compress_video(filename, level)
-            
-            elif action == 'extract_audio':
-                format_type = post_process_config.get('format', 'mp3')
-                quality = post_process_config.get('quality', '192k')
-                return self.ffmpeg_processor.extract_audio(filename, format_type, quality)
-            
-            elif action == 'convert':
-                format_type = post_process_config.get('format', 'mp4')
-                quality = post_process_config.get('quality', 'medium')
-                resolution = post_process_config.get('resolution')
-                return self.ffmpeg_processor.convert_video(filename, format_type, quality, resolution)
-            
-            elif action == 'trim':
-                start_time = post_process_config.get('start_time', '00:00:00')
-                duration = post_process_config.get('duration', '00:01:00')
-                return self.ffmpeg_processor.trim_video(filename, start_time, duration)
-            
-            elif action == 'watermark':
-                text = post_process_config.get('text', 'Downloaded with Advanced Downloader')
-                position = post_process_config.get('position', 'bottom-right')
-                return self.ffmpeg_processor.add_watermark(filename, text, position)
-            
-            else:
+            if action not in ProcessOpts.ACTIONS:
                 return filename
-                
+            
+            opts = ProcessOpts.from_dict({'text': 'Downloaded with Advanced Downloader', **post_process_config})
+            with self.ffmpeg_processor.report_progress(on_time):
+                return self.ffmpeg_processor.process(filename, action, opts)
+        
+        except FFmpegBusyError:
+            raise  # Never hand back the unprocessed file as if it were processed
         except Exception as e:
             print(f"Post-processing error: {e}")
             return filename  # Return original file if processing fails
@@ -498,7 +1636,7 @@ class AdvancedSocialMediaDownloader:
     def batch_download(self, urls, format_selector='best', task_id=None, post_process=None):
         """Download multiple URLs as a batch with optional post-processing"""
         if task_id:
-            DOWNLOAD_TASKS[task_id] = {
+            DOWNLOAD_TASKS.set(task_id, {
                 'status': 'starting',
                 'progress': 0,
                 'total_files': len(urls),
@@ -507,52 +1645,149 @@ class AdvancedSocialMediaDownloader:
                 'errors': [],
                 'start_time': datetime.now().isoformat(),
                 'post_processing': post_process is not None
-            }
+            })
         
         downloaded_files = []
         errors = []
+        completed = 0
         
-        for i, url in enumerate(urls):
-            try:
-                if task_id:
-                    DOWNLOAD_TASKS[task_id]['status'] = f'downloading {i+1}/{len(urls)}'
-                
-                filename, title = self.download_video(url, format_selector, post_process=post_process)
-                downloaded_files.append({'filename': filename, 'title': title, 'url': url})
-                
-                if task_id:
-                    DOWNLOAD_TASKS[task_id]['completed_files'] = i + 1
-                    DOWNLOAD_TASKS[task_id]['progress'] = ((i + 1) / len(urls)) * 100
-                    DOWNLOAD_TASKS[task_id]['files'].append({'title': title, 'status': 'completed'})
+        if task_id:
+            DOWNLOAD_TASKS.update(task_id, status=f'downloading 0/{len(urls)}')
+        
+        # Downloads are network/subprocess bound, so threads overlap well
+        with ThreadPoolExecutor(max_workers=min(8, len(urls))) as pool:
+            futures = {
+                pool.submit(self.download_video, url, format_selector, post_process=post_process,
+                            defer_post_process=True): (i, url)
+                for i, url in enumerate(urls)
+            }
+            
+            for future in as_completed(futures):
+                i, url = futures[future]
+                completed += 1
+                try:
+                    filename, title = future.result()
+                    downloaded_files.append({'filename': filename, 'title': title, 'url': url, 'index': i})
+                    
+                    if task_id:
+                        DOWNLOAD_TASKS.append(task_id, 'files', {'title': title, 'status': 'completed'})
+                        DOWNLOAD_TASKS.update(task_id, completed_files=len(downloaded_files))
                 
-            except Exception as e:
-                error_info = {'url': url, 'error': str(e)}
-                errors.append(error_info)
+                except Exception as e:
+                    error_info = {'url': url, 'error': str(e)}
+                    errors.append(error_info)
+                    
+                    if task_id:
+                        DOWNLOAD_TASKS.append(task_id, 'errors', error_info)
+                        DOWNLOAD_TASKS.append(task_id, 'files', {'url': url, 'status': 'error', 'error': str(e)})
                 
                 if task_id:
-                    DOWNLOAD_TASKS[task_id]['errors'].append(error_info)
-                    DOWNLOAD_TASKS[task_id]['files'].append({'url': url, 'status': 'error', 'error': str(e)})
+                    DOWNLOAD_TASKS.update(
+                        task_id,
+                        status=f'downloading {completed}/{len(urls)}',
+                        progress=(completed / len(urls)) * 100
+                    )
+        
+        # Keep results in request order
+        downloaded_files.sort(key=lambda f: f.pop('index'))
+        
+        if post_process and downloaded_files and self.ffmpeg_processor.ffmpeg_available:
+            if task_id:
+                DOWNLOAD_TASKS.update(task_id, status='post_processing')
+            
+            for file_info in downloaded_files:
+                file_info['post_process'] = post_process
+            self._apply_batch_post_processing(downloaded_files)
         
         if task_id:
-            DOWNLOAD_TASKS[task_id]['status'] = 'completed'
-            DOWNLOAD_TASKS[task_id]['progress'] = 100
+            DOWNLOAD_TASKS.update(task_id, status='completed', progress=100)
         
         return downloaded_files, errors
     
-    def create_zip_archive(self, files):
-        """Create a ZIP archive of downloaded files"""
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_info in files:
-                if os.path.exists(file_info['filename']):
-                    zip_file.write(file_info['filename'], 
-                                 os.path.basename(file_info['filename']))
+    def _apply_batch_post_processing(self, files):
+        """Post-process downloaded files, one FFmpeg run per shared configuration
+        
+        Files whose 'post_process' configs are identical conversions are encoded
+        together so process spawn and codec initialisation are paid once per
+        group rather than once per file. Filenames are updated in place.
+        """
+        def config_key(file_info):
+            return json.dumps(file_info['post_process'], sort_keys=True)
+        
+        for _, group in itertools.groupby(sorted(files, key=config_key), key=config_key):
+            group = list(group)
+            config = group[0]['post_process']
+            
+            if config.get('action') == 'convert' and len(group) > 1:
+                opts = ProcessOpts.from_dict(config)
+                try:
+                    output_paths = self.ffmpeg_processor.batch_convert(
+                        [f['filename'] for f in group],
+                        opts.video_format,
+                        opts.quality or 'medium',
+                        opts.resolution,
+                        opts.preset or FFmpegProcessor.DEFAULT_X264_PRESET,
+                        opts.hw_accel
+                    )
+                    for file_info, output_path in zip(group, output_paths):
+                        file_info['filename'] = output_path
+                    continue
+                except Exception as e:
+                    print(f"Batch post-processing error, processing files individually: {e}")
+            
+            # One worker per job slot; more would only queue on the slots
+            with ThreadPoolExecutor(max_workers=self.ffmpeg_processor.max_jobs) as pool:
+                results = pool.map(lambda f: self._apply_post_processing(f['filename'], config), group)
+                for file_info, filename in zip(group, results):
+                    file_info['filename'] = filename
+    
+    def create_zip_stream(self, files, chunk_size=1 << 20):
+        """Stream a ZIP archive of downloaded files
+        
+        Returns a generator of archive bytes suitable for a Flask Response, so
+        memory use stays around chunk_size regardless of the archive size.
+        Entries are stored uncompressed since video/audio are already compressed.
+        """
+        def generate():
+            sink = _ZipStreamSink()
+            
+            with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zip_file:
+                for file_info in files:
+                    path = file_info['filename']
+                    if not os.path.exists(path):
+                        continue
+                    
+                    zinfo = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+                    with open(path, 'rb') as src, zip_file.open(zinfo, 'w', force_zip64=True) as dest:
+                        while chunk := src.read(chunk_size):
+                            dest.write(chunk)
+                            yield from sink.drain()
+                    yield from sink.drain()
+            
+            yield from sink.drain()
         
-        zip_buffer.seek(0)
-        return zip_buffer
+        return generate()
+
+class _ZipStreamSink:
+    """Unseekable write target that lets create_zip_stream yield ZIP bytes as written"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        if chunks:
+            yield b''.join(chunks)
 
 downloader = AdvancedSocialMediaDownloader()
+trim_batcher = TrimBatcher(downloader.ffmpeg_processor)
 
 @app.route('/', methods=['GET'])
 def home():
@@ -621,6 +1856,22 @@ def get_video_info():
             'error': str(e)
         }), 500
 
+def resolve_post_process(post_process):
+    """Expand a processing preset name into its options dict
+    
+    Raises ValueError for unknown presets and anything that isn't a dict, so a
+    bad value is rejected up front instead of failing in a download thread.
+    """
+    if not post_process:
+        return None
+    if isinstance(post_process, str):
+        if post_process not in downloader.processing_presets:
+            raise ValueError(f'Unknown processing preset: {post_process}')
+        return downloader.processing_presets[post_process]
+    if not isinstance(post_process, dict):
+        raise ValueError('post_process must be a preset name or an options object')
+    return post_process
+
 @app.route('/api/download', methods=['POST'])
 def download_video():
     """Enhanced download endpoint with FFmpeg processing options"""
@@ -639,8 +1890,10 @@ def download_video():
             format_selector = downloader.format_presets[format_selector]
         
         # Use processing preset if provided
-        if post_process and isinstance(post_process, str) and post_process in downloader.processing_presets:
-            post_process = downloader.processing_presets[post_process]
+        try:
+            post_process = resolve_post_process(post_process)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         filepath, title = downloader.download_video(
             url, format_selector, 
@@ -649,11 +1902,7 @@ def download_video():
         )
         
         if os.path.exists(filepath):
-            return send_file(
-                filepath,
-                as_attachment=True,
-                download_name=f"{title}.{filepath.split('.')[-1]}"
-            )
+            return file_response(filepath, f"{title}.{filepath.split('.')[-1]}")
         else:
             return jsonify({'error': 'Download failed'}), 500
     
@@ -683,8 +1932,10 @@ def async_download():
             format_selector = downloader.format_presets[format_selector]
         
         # Use processing preset if provided
-        if post_process and isinstance(post_process, str) and post_process in downloader.processing_presets:
-            post_process = downloader.processing_presets[post_process]
+        try:
+            post_process = resolve_post_process(post_process)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Start download in background thread
         thread = threading.Thread(
@@ -729,8 +1980,10 @@ def batch_download():
             format_selector = downloader.format_presets[format_selector]
         
         # Use processing preset if provided
-        if post_process and isinstance(post_process, str) and post_process in downloader.processing_presets:
-            post_process = downloader.processing_presets[post_process]
+        try:
+            post_process = resolve_post_process(post_process)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Start batch download in background
         thread = threading.Thread(
@@ -753,6 +2006,102 @@ def batch_download():
             'error': str(e)
         }), 500
 
+def confine_temp_path(path):
+    """Canonicalise a client-supplied path, raising ValueError if it escapes TEMP_DIR"""
+    real_path = os.path.realpath(path)
+    if not real_path.startswith(TEMP_DIR_REAL + os.sep):
+        raise ValueError(f'Path is outside the temp directory: {path}')
+    return real_path
+
+def resolve_temp_path(path):
+    """Canonicalise a client-supplied path, rejecting anything outside TEMP_DIR
+    
+    Returns (realpath, os.stat result); raises ValueError for paths that escape
+    the temp directory and OSError for missing files.
+    """
+    real_path = confine_temp_path(path)
+    return real_path, os.stat(real_path)
+
+def missing_paths(paths):
+    """Return the paths that don't exist, in request order
+    
+    Files directly under TEMP_DIR are checked against a single directory scan;
+    anything else is stat'ed concurrently so slow filesystems overlap.
+    """
+    temp_names = {entry.name for entry in os.scandir(TEMP_DIR_REAL)}
+    missing = set()
+    others = []
+    for path in paths:
+        if os.path.dirname(os.path.abspath(path)) == TEMP_DIR_REAL:
+            if os.path.basename(path) not in temp_names:
+                missing.add(path)
+        else:
+            others.append(path)
+    
+    if others:
+        with ThreadPoolExecutor(max_workers=min(16, len(others))) as executor:
+            for path, exists in zip(others, executor.map(os.path.exists, others)):
+                if not exists:
+                    missing.add(path)
+    
+    return [path for path in paths if path in missing]
+
+def content_disposition(download_name):
+    ascii_name = download_name.encode('ascii', 'replace').decode().replace('"', '')
+    return f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(download_name)}'
+
+def file_response(path, download_name, st=None):
+    """Send a file from TEMP_DIR as an attachment
+    
+    With SENDFILE_BACKEND set, only headers are returned and the reverse proxy
+    sends the body itself. For nginx, map SENDFILE_PREFIX to TEMP_ROOT:
+    
+        location /internal/ { internal; alias /srv/vid-temp/; }
+    
+    Otherwise the body is served through wsgi.file_wrapper (sendfile(2) on
+    servers that support it). st is the file's os.stat result, when the caller
+    already has one.
+    """
+    temp_root = os.path.dirname(TEMP_DIR)
+    if SENDFILE_BACKEND and os.path.commonpath([temp_root, os.path.abspath(path)]) == temp_root:
+        mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+        response = Response(mimetype=mimetype)
+        response.headers['Content-Disposition'] = content_disposition(download_name)
+        if SENDFILE_BACKEND == 'nginx':
+            relative = os.path.relpath(os.path.abspath(path), temp_root)
+            response.headers['X-Accel-Redirect'] = SENDFILE_PREFIX + quote(relative)
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        return response
+    
+    st = st or os.stat(path)
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response = Response(
+        wrap_file(request.environ, open(path, 'rb'), buffer_size=64 * 1024),
+        mimetype=mimetype,
+        direct_passthrough=True
+    )
+    response.headers['Content-Disposition'] = content_disposition(download_name)
+    response.content_length = st.st_size
+    response.last_modified = st.st_mtime
+    response.set_etag(f'{st.st_mtime_ns:x}-{st.st_size:x}')
+    # Handles If-None-Match/If-Modified-Since and Range like send_file did
+    return response.make_conditional(request.environ, accept_ranges=True, complete_length=st.st_size)
+
+def stream_response(chunks, download_name):
+    """Send FFmpeg's piped output as an attachment without touching disk"""
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = content_disposition(download_name)
+    return response
+
+def busy_response(e):
+    """503 telling the client when to retry, for requests that found no free FFmpeg slot"""
+    response = jsonify({'success': False, 'error': str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(downloader.ffmpeg_processor.queue_timeout) or 1)
+    return response
+
 @app.route('/api/process-video', methods=['POST'])
 def process_video():
     """Process uploaded video with FFmpeg"""
@@ -763,57 +2112,46 @@ def process_video():
         data = request.get_json()
         file_path = data.get('file_path')
         processing_type = data.get('type')
-        options = data.get('options', {})
+        opts = ProcessOpts.from_dict(data.get('options'))
         
-        if not file_path or not os.path.exists(file_path):
+        if not file_path:
+            return jsonify({'error': 'Valid file path required'}), 400
+        try:
+            # One stat serves both the existence check and the info cache key
+            file_path, st = resolve_temp_path(file_path)
+        except (ValueError, OSError):
             return jsonify({'error': 'Valid file path required'}), 400
         
-        result_path = None
-        
-        if processing_type == 'compress':
-            level = options.get('level', 'medium')
-            result_path = downloader.ffmpeg_processor.compress_video(file_path, level)
-        
-        elif processing_type == 'extract_audio':
-            format_type = options.get('format', 'mp3')
-            quality = options.get('quality', '192k')
-            result_path = downloader.ffmpeg_processor.extract_audio(file_path, format_type, quality)
-        
-        elif processing_type == 'convert':
-            format_type = options.get('format', 'mp4')
-            quality = options.get('quality', 'medium')
-            resolution = options.get('resolution')
-            result_path = downloader.ffmpeg_processor.convert_video(file_path, format_type, quality, resolution)
-        
-        elif processing_type == 'trim':
-            start_time = options.get('start_time', '00:00:00')
-            duration = options.get('duration', '00:01:00')
-            result_path = downloader.ffmpeg_processor.trim_video(file_path, start_time, duration)
-        
-        elif processing_type == 'watermark':
-            text = options.get('text', 'Processed Video')
-            position = options.get('position', 'bottom-right')
-            result_path = downloader.ffmpeg_processor.add_watermark(file_path, text, position)
+        stem = Path(file_path).stem
         
-        elif processing_type == 'info':
-            video_info = downloader.ffmpeg_processor.get_video_info(file_path)
+        if processing_type == 'info':
+            video_info = downloader.ffmpeg_processor.get_video_info(file_path, st)
             return jsonify({
                 'success': True,
                 'info': video_info
             })
         
-        else:
+        if processing_type not in ProcessOpts.ACTIONS:
             return jsonify({'error': 'Invalid processing type'}), 400
         
-        if result_path and os.path.exists(result_path):
-            return send_file(
-                result_path,
-                as_attachment=True,
-                download_name=os.path.basename(result_path)
-            )
-        else:
+        # Trims stay on disk so concurrent requests can share one FFmpeg run
+        if processing_type == 'trim':
+            result_path = trim_batcher.trim(file_path, opts.start_time, opts.duration)
+            if result_path and os.path.exists(result_path):
+                return file_response(result_path, os.path.basename(result_path))
             return jsonify({'error': 'Processing failed'}), 500
+        
+        # Everything else is piped from FFmpeg straight into the response,
+        # unless the output format has no muxer that can write to a pipe
+        download_name = opts.download_name(processing_type, stem)
+        if Path(download_name).suffix[1:] not in FFmpegProcessor.PIPE_MUXERS:
+            result_path = downloader.ffmpeg_processor.process(file_path, processing_type, opts)
+            return file_response(result_path, download_name)
+        chunks = downloader.ffmpeg_processor.process(file_path, processing_type, opts, stdout_pipe=True)
+        return stream_response(chunks, download_name)
     
+    except FFmpegBusyError as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -834,73 +2172,137 @@ def merge_videos():
         if len(file_paths) < 2:
             return jsonify({'error': 'At least 2 video files required'}), 400
         
-        # Verify all files exist
+        # Only files under TEMP_DIR may be merged
+        real_paths = []
         for path in file_paths:
-            if not os.path.exists(path):
-                return jsonify({'error': f'File not found: {path}'}), 400
+            try:
+                real_paths.append(confine_temp_path(path))
+            except ValueError:
+                return jsonify({'error': f'File not allowed: {path}'}), 400
         
-        result_path = downloader.ffmpeg_processor.merge_videos(file_paths, output_format)
+        # Verify all files exist
+        missing = missing_paths(real_paths)
+        if missing:
+            return jsonify({'error': f'File not found: {file_paths[real_paths.index(missing[0])]}'}), 400
+        file_paths = real_paths
         
-        if result_path and os.path.exists(result_path):
-            return send_file(
-                result_path,
-                as_attachment=True,
-                download_name=f'merged_video.{output_format}'
-            )
-        else:
-            return jsonify({'error': 'Merge failed'}), 500
+        if output_format not in FFmpegProcessor.PIPE_MUXERS:
+            result_path = downloader.ffmpeg_processor.merge_videos(file_paths, output_format)
+            return file_response(result_path, f'merged_video.{output_format}')
+        chunks = downloader.ffmpeg_processor.merge_videos(file_paths, output_format, stdout_pipe=True)
+        
+        return stream_response(chunks, f'merged_video.{output_format}')
     
+    except FFmpegBusyError as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+PROGRESS_KEEPALIVE = 15  # seconds between SSE keepalive comments
+# Each open SSE feed pins a gunicorn thread, so feeds are capped in number and
+# closed after PROGRESS_STREAM_MAX_AGE; EventSource reconnects on its own
+PROGRESS_STREAM_MAX_AGE = int(os.environ.get('PROGRESS_STREAM_MAX_AGE', 300))
+PROGRESS_STREAM_RETRY_MS = 3000
+PROGRESS_STREAMS = threading.BoundedSemaphore(int(os.environ.get('PROGRESS_STREAM_MAX', 8)))
+
+def progress_etag(task):
+    """Strong ETag over the task fields that change as work progresses"""
+    state = (
+        task['status'], task.get('progress'), task.get('filename'), task.get('error'),
+        task.get('completed_files'), len(task.get('files', ())), len(task.get('errors', ()))
+    )
+    return hashlib.blake2b(repr(state).encode(), digest_size=8).hexdigest()
+
 @app.route('/api/progress/<task_id>', methods=['GET'])
 def get_download_progress(task_id):
     """Get download progress for a task"""
-    if task_id not in DOWNLOAD_TASKS:
+    # Expired tasks (an hour after their last update) are dropped first
+    DOWNLOAD_TASKS.sweep()
+    task = DOWNLOAD_TASKS.get(task_id)
+    if task is None:
         return jsonify({'error': 'Task not found'}), 404
     
-    task = DOWNLOAD_TASKS[task_id]
+    # Most polls land between updates; answer those with a bodiless 304
+    etag = progress_etag(task)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(task)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=1'
+    return response
+
+@app.route('/api/progress/<task_id>/stream', methods=['GET'])
+def stream_download_progress(task_id):
+    """Server-Sent Events feed of a task, pushed whenever it changes"""
+    DOWNLOAD_TASKS.sweep()
+    if task_id not in DOWNLOAD_TASKS:
+        return jsonify({'error': 'Task not found'}), 404
+    if not PROGRESS_STREAMS.acquire(blocking=False):
+        # Plain polling of /api/progress/<task_id> still works
+        response = jsonify({'error': 'Too many progress streams, poll /api/progress instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(PROGRESS_STREAM_RETRY_MS // 1000)
+        return response
     
-    # Clean up completed tasks older than 1 hour
-    if task['status'] in ['completed', 'error']:
-        try:
-            start_time = datetime.fromisoformat(task['start_time'])
-            if (datetime.now() - start_time).total_seconds() > 3600:
-                del DOWNLOAD_TASKS[task_id]
-                return jsonify({'error': 'Task expired'}), 404
-        except:
-            pass
+    def events():
+        yield f'retry: {PROGRESS_STREAM_RETRY_MS}\n\n'
+        deadline = time.monotonic() + PROGRESS_STREAM_MAX_AGE
+        revision = None
+        while (remaining := deadline - time.monotonic()) > 0:
+            task, new_revision = DOWNLOAD_TASKS.wait_for_change(task_id, revision,
+                                                                timeout=min(PROGRESS_KEEPALIVE, remaining))
+            if task is None:
+                yield 'event: expired\ndata: {}\n\n'
+                return
+            if new_revision == revision:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            revision = new_revision
+            yield f'data: {orjson.dumps(task, option=orjson.OPT_NON_STR_KEYS).decode()}\n\n'
+            if task['status'] in ('completed', 'error'):
+                return
     
-    return jsonify(task)
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    # Runs when the server closes the response, even if the feed never started
+    response.call_on_close(PROGRESS_STREAMS.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/download/file/<task_id>', methods=['GET'])
 def download_completed_file(task_id):
     """Download completed file by task ID"""
-    if task_id not in DOWNLOAD_TASKS:
+    task = DOWNLOAD_TASKS.get(task_id)
+    if task is None:
         return jsonify({'error': 'Task not found'}), 404
     
-    task = DOWNLOAD_TASKS[task_id]
-    
     if task['status'] != 'completed':
         return jsonify({'error': 'Download not completed'}), 400
     
     filename = task.get('filename')
-    if not filename or not os.path.exists(filename):
+    try:
+        st = os.stat(filename) if filename else None
+    except OSError:
+        st = None
+    if st is None:
         return jsonify({'error': 'File not found'}), 404
     
-    return send_file(
-        filename,
-        as_attachment=True,
-        download_name=os.path.basename(filename)
-    )
+    return file_response(filename, os.path.basename(filename), st)
 
-@app.route('/api/formats', methods=['GET'])
-def get_format_presets():
-    """Get available format presets including FFmpeg processing options"""
-    return jsonify({
+# Responses that only depend on startup state are encoded once per process
+STATIC_CACHE_CONTROL = 'public, max-age=60'
+
+def static_json_response(body):
+    return Response(body, mimetype='application/json', headers={'Cache-Control': STATIC_CACHE_CONTROL})
+
+@functools.lru_cache(maxsize=None)
+def _format_presets_json():
+    return orjson.dumps({
         'download_presets': downloader.format_presets,
         'processing_presets': downloader.processing_presets,
         'descriptions': {
@@ -925,12 +2327,17 @@ def get_format_presets():
         'ffmpeg_available': downloader.ffmpeg_processor.ffmpeg_available
     })
 
-@app.route('/api/ffmpeg/status', methods=['GET'])
-def ffmpeg_status():
-    """Check FFmpeg availability and capabilities"""
+@app.route('/api/formats', methods=['GET'])
+def get_format_presets():
+    """Get available format presets including FFmpeg processing options"""
+    return static_json_response(_format_presets_json())
+
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_status_json():
     processor = downloader.ffmpeg_processor
-    return jsonify({
+    return orjson.dumps({
         'available': processor.ffmpeg_available,
+        'hardware_encoders': processor.hw_encoders,
         'capabilities': [
             'Video compression',
             'Audio extraction',
@@ -948,52 +2355,48 @@ def ffmpeg_status():
         } if processor.ffmpeg_available else {}
     })
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Enhanced health check with FFmpeg status"""
-    return jsonify({
+@app.route('/api/ffmpeg/status', methods=['GET'])
+def ffmpeg_status():
+    """Check FFmpeg availability and capabilities"""
+    return static_json_response(_ffmpeg_status_json())
+
+@functools.lru_cache(maxsize=None)
+def _health_info():
+    return {
         'status': 'healthy',
         'version': '2.1.0',
         'temp_dir': TEMP_DIR,
         'supported_platforms': len(downloader.supported_platforms),
-        'active_tasks': len(DOWNLOAD_TASKS),
         'ffmpeg_available': downloader.ffmpeg_processor.ffmpeg_available,
         'features': [
             'multi-format', 'batch-download', 'progress-tracking', 
             'subtitles', 'ffmpeg-processing', 'video-compression',
             'audio-extraction', 'format-conversion', 'video-merging'
         ]
-    })
+    }
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Enhanced health check with FFmpeg status"""
+    # active_tasks changes constantly, so this one is encoded per request and not cached
+    return jsonify({**_health_info(), 'active_tasks': len(DOWNLOAD_TASKS)})
 
 @app.route('/api/cleanup', methods=['POST'])
 def cleanup_files():
     """Clean up temporary files"""
     try:
-        cleaned = 0
-        for file in os.listdir(TEMP_DIR):
-            file_path = os.path.join(TEMP_DIR, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-                cleaned += 1
+        # DirEntry.is_file() reuses the type from the directory read
+        with os.scandir(TEMP_DIR) as entries:
+            file_paths = [entry.path for entry in entries if entry.is_file()]
+        cleaned = unlink_many(file_paths)
         
         # Clean up expired tasks
-        current_time = datetime.now()
-        expired_tasks = []
-        for task_id, task in DOWNLOAD_TASKS.items():
-            try:
-                start_time = datetime.fromisoformat(task['start_time'])
-                if (current_time - start_time).total_seconds() > 3600:
-                    expired_tasks.append(task_id)
-            except:
-                expired_tasks.append(task_id)
-        
-        for task_id in expired_tasks:
-            del DOWNLOAD_TASKS[task_id]
+        tasks_cleaned = DOWNLOAD_TASKS.sweep()
         
         return jsonify({
             'success': True,
             'files_cleaned': cleaned,
-            'tasks_cleaned': len(expired_tasks)
+            'tasks_cleaned': tasks_cleaned
         })
     
     except Exception as e:
@@ -1025,4 +2428,7 @@ if __name__ == '__main__':
     print(f"Supported Platforms: {len(downloader.supported_platforms)}")
     print("=== Starting Server ===")
     
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # Development only; production runs gunicorn against wsgi:application.
+    # debug=True would start the reloader, a second process with its own
+    # TEMP_DIR and task store.
+    app.run(host='0.0.0.0', port=port, threaded=True)